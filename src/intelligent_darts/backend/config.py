@@ -10,6 +10,11 @@ from typing import Optional
 project_root = Path(__file__).parent.parent.parent.parent
 env_file = project_root / ".env"
 
+# resolved once - the SPA fallback handler reads it on every unmatched route
+static_assets_path = Path(str(resources.files(app_slug))).joinpath("__dist__")
+
+# .env is parsed exactly once, here; AppConfig reads the resulting environment
+# variables, which keeps the same precedence (real env vars win over .env)
 if env_file.exists():
     load_dotenv(dotenv_path=env_file)
 
@@ -24,18 +29,36 @@ class DatabaseConfig(BaseModel):
 
 class AppConfig(BaseSettings):
     model_config = SettingsConfigDict(
-        env_file=env_file,
         env_prefix=f"{app_slug.upper()}_",
         extra="ignore",
         env_nested_delimiter="__",
     )
     app_name: str = Field(default=app_name)
     api_prefix: str = Field(default="/api")
+    serving_max_connections: int = Field(
+        default=32,
+        description="Maximum concurrent model serving calls; also the number of keep-alive "
+        "connections kept to the workspace host (the SDK's max_connection_pools)",
+    )
+    serving_retry_timeout_seconds: int = Field(
+        default=30,
+        description="Time budget for the SDK's own retries of throttled or unreachable model serving calls",
+    )
+    serving_hedge_with_validator: bool = Field(
+        default=False,
+        description="Send the format-correction prompt in parallel with each interactive detection "
+        "and use whichever answer parses first (lower tail latency, about twice the model calls)",
+    )
+    serving_structured_output: bool = Field(
+        default=False,
+        description="Ask model endpoints for JSON-schema constrained scores (response_format); "
+        "endpoints that reject it are remembered and sent plain-text requests instead",
+    )
     # db: Optional[DatabaseConfig] = Field(default=None)  # Disabled for now
 
     @property
     def static_assets_path(self) -> Path:
-        return Path(str(resources.files(app_slug))).joinpath("__dist__")
+        return static_assets_path
 
 
 try:
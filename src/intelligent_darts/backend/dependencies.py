@@ -1,8 +1,11 @@
+from functools import lru_cache
 from databricks.sdk import WorkspaceClient
 from fastapi import Header
 from typing import Annotated, Generator
 from sqlmodel import Session
+from .config import conf
 from .runtime import rt
+from .score_detection_service import ScoreDetectionService
 
 
 def get_obo_ws(
@@ -33,8 +36,25 @@ def get_app_ws() -> WorkspaceClient:
     """
     Returns a Databricks Workspace client using the app's service principal credentials.
     This should be used for operations that require app-level permissions (like accessing serving endpoints).
+
+    This is the runtime's client, created once per process and shared across requests, so the SDK's
+    keep-alive HTTP session and auth state are reused instead of being rebuilt on every call.
+    """
+    # Uses app's service principal credentials from environment
+    return rt.ws
+
+
+@lru_cache(maxsize=1)
+def get_score_detection_service() -> ScoreDetectionService:
+    """
+    Returns the shared score detection service, bound to the app's workspace client.
     """
-    return WorkspaceClient()  # Uses app's service principal credentials from environment
+    return ScoreDetectionService(
+        get_app_ws(),
+        max_concurrent_calls=conf.serving_max_connections,
+        hedge_with_validator=conf.serving_hedge_with_validator,
+        structured_output=conf.serving_structured_output,
+    )
 
 
 def get_session() -> Generator[Session, None, None]:
@@ -1,7 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from .. import __version__
 
+# Upper bound for an encoded frame (~500 KB of JPEG). The UI downscales frames well
+# below this, so larger payloads indicate a client regression rather than a real need.
+MAX_IMAGE_BASE64_LENGTH = 700_000
+
 
 class VersionOut(BaseModel):
     version: str
@@ -27,14 +31,20 @@ class GameStatusOut(BaseModel):
 
 class ScoreDetectionIn(BaseModel):
     """Input model for score detection from video frames"""
-    before_image_base64: str = Field(
-        description="Base64 encoded image of the dartboard before the throw"
+    before_image_base64: Optional[str] = Field(
+        default=None,
+        description="Base64 encoded image of the dartboard before the throw (raw or as a data URI). Not used for detection and can be omitted",
+        max_length=MAX_IMAGE_BASE64_LENGTH,
+        repr=False
     )
     after_image_base64: str = Field(
-        description="Base64 encoded image of the dartboard after the throw"
+        description="Base64 encoded image of the dartboard after the throw (raw or as a data URI)",
+        max_length=MAX_IMAGE_BASE64_LENGTH,
+        repr=False
     )
-    before_timestamp: float = Field(
-        description="Timestamp of the before image in seconds"
+    before_timestamp: Optional[float] = Field(
+        default=None,
+        description="Timestamp of the before image in seconds. Not used for detection and can be omitted"
     )
     after_timestamp: float = Field(
         description="Timestamp of the after image in seconds"
@@ -1,15 +1,22 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from typing import Annotated, List
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
 from .models import VersionOut, VideoStreamOut, GameStatusOut, ScoreDetectionIn, ScoreDetectionOut
 from databricks.sdk import WorkspaceClient
 from databricks.sdk.service.iam import User as UserOut
-from .dependencies import get_obo_ws, get_app_ws
+from .dependencies import get_obo_ws, get_score_detection_service
 from .config import conf
 from .score_detection_service import ScoreDetectionService
 from .logger import logger
 
 api = APIRouter(prefix=conf.api_prefix)
 
+# Caps concurrent model calls from batch detection to avoid endpoint throttling
+batch_detection_semaphore = asyncio.Semaphore(8)
+
+# Each frame can carry up to ~1.4 MB of base64, so batches are kept small
+MAX_BATCH_SIZE = 16
+
 
 @api.get("/version", response_model=VersionOut, operation_id="version")
 async def version():
@@ -43,46 +50,48 @@ async def get_game_status():
     )
 
 
+def _to_score_detection_out(scores: List[int], raw_response: str) -> ScoreDetectionOut:
+    # Calculate confidence based on whether we got valid scores
+    # In a real implementation, you might want to get this from the model
+    confidence = 0.95 if any(s > 0 for s in scores) else 0.5
+    return ScoreDetectionOut(
+        scores=scores,
+        confidence=confidence,
+        raw_response=raw_response
+    )
+
+
 @api.post("/detect-score", response_model=ScoreDetectionOut, operation_id="detectScore")
 async def detect_score(
     request: ScoreDetectionIn,
-    app_ws: Annotated[WorkspaceClient, Depends(get_app_ws)]
+    service: Annotated[ScoreDetectionService, Depends(get_score_detection_service)]
 ):
     """
-    Detect the score from before/after dartboard images using Claude Sonnet 4.5
+    Detect the dart scores in a dartboard frame using Claude Sonnet 4.5
     
-    This endpoint analyzes two timestamped images of a dartboard and uses AI
-    to determine what score was achieved by the newly thrown dart.
+    This endpoint analyzes the "after" frame of a dartboard and uses AI to
+    determine the score of each dart on the board. The "before" fields are
+    optional and ignored.
     """
     try:
-        logger.info(
-            f"Detecting score from images at timestamps "
-            f"{request.before_timestamp:.2f}s and {request.after_timestamp:.2f}s"
-        )
+        logger.info("Detecting score from the frame at timestamp %.2fs", request.after_timestamp)
         
-        # Create the score detection service
-        service = ScoreDetectionService(app_ws)
-        
-        # Detect the scores
-        scores, raw_response = service.detect_score(
-            before_image_base64=request.before_image_base64,
-            after_image_base64=request.after_image_base64,
-            before_timestamp=request.before_timestamp,
-            after_timestamp=request.after_timestamp,
+        # Detect the scores - the SDK call is blocking, so it runs off the event loop.
+        # Only the "after" frame is analyzed; the "before" fields are accepted for
+        # compatibility with older clients and ignored
+        scores, raw_response = await service.detect_score_async(
+            image_base64=request.after_image_base64,
+            timestamp=request.after_timestamp,
             model_endpoint=request.model
         )
         
-        # Calculate confidence based on whether we got valid scores
-        # In a real implementation, you might want to get this from the model
-        confidence = 0.95 if any(s > 0 for s in scores) else 0.5
+        result = _to_score_detection_out(scores, raw_response)
         
-        logger.info(f"Detected {len(scores)} dart score(s): {scores} (confidence: {confidence})")
+        logger.info("Detected %d dart score(s): %s (confidence: %s)", len(scores), scores, result.confidence)
         
-        return ScoreDetectionOut(
-            scores=scores,
-            confidence=confidence,
-            raw_response=raw_response
-        )
+        # Serialize with pydantic-core directly; returning a Response skips FastAPI's
+        # re-validation of the model and the stdlib json encoder
+        return Response(content=result.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         logger.error(f"Error in detect_score endpoint: {str(e)}", exc_info=True)
@@ -90,3 +99,41 @@ async def detect_score(
             status_code=500,
             detail=f"Failed to detect score: {str(e)}"
         )
+
+
+@api.post("/detect-scores-batch", response_model=List[ScoreDetectionOut], operation_id="detectScoresBatch")
+async def detect_scores_batch(
+    requests: Annotated[List[ScoreDetectionIn], Body(max_length=MAX_BATCH_SIZE)],
+    service: Annotated[ScoreDetectionService, Depends(get_score_detection_service)]
+):
+    """
+    Detect the scores for several frames at once
+
+    Frames are analyzed concurrently, so a burst of throws takes about one model
+    round trip instead of one per frame. Results are returned in request order.
+    """
+
+    async def detect_one(request: ScoreDetectionIn) -> ScoreDetectionOut:
+        async with batch_detection_semaphore:
+            scores, raw_response = await service.detect_score_async(
+                image_base64=request.after_image_base64,
+                timestamp=request.after_timestamp,
+                model_endpoint=request.model
+            )
+        return _to_score_detection_out(scores, raw_response)
+
+    logger.info("Detecting scores for a batch of %d frame(s)", len(requests))
+    tasks = [asyncio.ensure_future(detect_one(request)) for request in requests]
+    try:
+        return await asyncio.gather(*tasks)
+
+    except Exception as e:
+        # The batch fails as a whole, so frames still waiting for a slot are dropped
+        # instead of calling the model for a response nobody will read
+        for task in tasks:
+            task.cancel()
+        logger.error(f"Error in detect_scores_batch endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to detect scores: {str(e)}"
+        )
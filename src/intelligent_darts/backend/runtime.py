@@ -1,3 +1,5 @@
+from functools import cached_property
+from databricks.sdk.config import Config
 from databricks.sdk.errors import NotFound
 from sqlalchemy import Engine
 from .config import conf, AppConfig
@@ -11,11 +13,19 @@ class Runtime:
     def __init__(self):
         self.config: AppConfig = conf
 
-    @property
+    @cached_property
     def ws(self) -> WorkspaceClient:
         # note - this workspace client is usually an SP-based client
         # in development it usually uses the DATABRICKS_CONFIG_PROFILE
-        return WorkspaceClient()
+        # created once per process, so every caller shares its keep-alive connection pool
+        config = Config(
+            # despite its name, this sets the per-host pool size (urllib3 pool_maxsize) in
+            # the SDK; the pool blocks when full, so it must cover every concurrent model call
+            max_connection_pools=self.config.serving_max_connections,
+            # the SDK default (5 minutes) is far longer than anyone waits for a score
+            retry_timeout_seconds=self.config.serving_retry_timeout_seconds,
+        )
+        return WorkspaceClient(config=config)
 
     @property
     def engine_url(self) -> str:
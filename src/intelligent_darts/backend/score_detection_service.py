@@ -1,16 +1,89 @@
 """Service for detecting dart scores using Claude Sonnet 4.5 model"""
+import asyncio
 import base64
+import hashlib
+import json
 import os
-from typing import Tuple, List
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Tuple, List, Optional, Set
+import anyio
+import anyio.to_thread
 from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.serving import ChatMessage, ChatMessageRole
+from databricks.sdk.errors import BadRequest, DeadlineExceeded, InternalError
 from .logger import logger
 
+# Bytes that may separate scores in a well-formed answer ("20, 60, 50")
+_SCORE_SEPARATORS = frozenset(b", \t\r\n")
+_NO_DARTS_RE = re.compile(r"no dart|no visible dart|empty|none", re.IGNORECASE)
+# A 400 that mentions these is the endpoint rejecting structured output itself
+_RESPONSE_FORMAT_ERROR_RE = re.compile(r"response_format|json_schema|structured output", re.IGNORECASE)
 
-class ScoreDetectionService:
-    """Service for detecting dart scores from images using AI models"""
-    
-    SYSTEM_PROMPT = """You are a professional darts scoring agent. Analyze the provided dartboard image and identify ALL darts currently stuck in the board.
+# "60, 60, 60" is under 10 tokens; the stop sequences end generation as soon as the
+# model drifts into a sentence or an explanation. No whitespace-only stops: the
+# Anthropic API rejects them, and a leading newline would end the answer empty
+MAX_SCORE_TOKENS = 16
+MAX_CORRECTION_TOKENS = 12
+SCORE_STOP_SEQUENCES = [".", "Explanation"]
+
+# Reasoning endpoints spend hidden thinking tokens out of max_tokens before they
+# answer, so the answer-sized caps above would leave them with an empty reply
+REASONING_ENDPOINTS = frozenset({"databricks-gpt-5-1", "databricks-gemini-3-pro"})
+REASONING_MAX_TOKENS = 4096
+
+# JSON schema for structured output: the endpoint constrains decoding to this shape, so
+# well-formed answers always parse. Endpoints that reject it fall back to plain text
+SCORES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "DartScores",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "scores": {
+                    "type": "array",
+                    "items": {"type": "integer", "minimum": 0, "maximum": 60},
+                    "maxItems": 3
+                }
+            },
+            "required": ["scores"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+# '{"scores": [60, 60, 60]}' needs more tokens than the bare numbers, and stop sequences
+# are not sent with the schema since they could cut the object short
+MAX_STRUCTURED_SCORE_TOKENS = 32
+
+# Transport retries for transient server errors (exponential backoff with full jitter)
+QUERY_MAX_ATTEMPTS = 3
+QUERY_BACKOFF_INITIAL_SECONDS = 0.25
+QUERY_BACKOFF_MAX_SECONDS = 4.0
+
+# Set DEBUG_SAVE_IMAGES=true to write every analyzed frame to the temp directory. The
+# frames are decoded and written on a single background thread, off the request path
+_DEBUG_SAVE_IMAGES = os.getenv("DEBUG_SAVE_IMAGES", "").lower() == "true"
+_DEBUG_IMAGE_DIR = Path(tempfile.gettempdir()) / "intelligent_darts_debug"
+_DEBUG_EXECUTOR: Optional[ThreadPoolExecutor] = None
+if _DEBUG_SAVE_IMAGES:
+    _DEBUG_IMAGE_DIR.mkdir(exist_ok=True)
+    _DEBUG_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-images")
+
+# Number of recent detections kept per service, keyed by a hash of the frame
+DETECTION_CACHE_SIZE = 256
+
+# Keep the system prompt (and the analyze instruction below) constant: every request
+# then starts with a byte-identical prefix, which provider-side prompt caching can reuse.
+# Never interpolate per-request values into it.
+SYSTEM_PROMPT = """You are a professional darts scoring agent. Analyze the provided dartboard image and identify ALL darts currently stuck in the board.
 
 TASK:
 Carefully examine the dartboard image and:
@@ -31,6 +104,7 @@ CRITICAL INSTRUCTIONS:
 - Do NOT sum the scores together
 - Do NOT add any labels, explanations, or extra text
 - Count each dart separately
+- Stop immediately after the last number
 
 OUTPUT FORMAT (numbers only, separated by commas):
 - If 3 darts visible: "20, 60, 50"
@@ -41,16 +115,117 @@ OUTPUT FORMAT (numbers only, separated by commas):
 ONLY return the comma-separated numbers. Nothing else.
 """
 
-    def __init__(self, workspace_client: WorkspaceClient):
+
+def _write_debug_image(image_base64: str, timestamp: float) -> None:
+    """Decode an analyzed frame and save it to the debug directory"""
+    try:
+        image_path = _DEBUG_IMAGE_DIR / f"frame_{timestamp:.2f}s.jpg"
+        image_path.write_bytes(base64.b64decode(image_base64.split(",", 1)[-1], validate=True))
+        logger.info(f"DEBUG: Saved image to {image_path}")
+    except Exception as e:
+        logger.warning(f"Failed to save debug image: {e}")
+
+
+class ScoreDetectionService:
+    """
+    Service for detecting dart scores from images using AI models
+    
+    Create one instance per process and share it (see get_score_detection_service):
+    the detection cache, the in-flight table and the worker limiter live on the
+    instance, and the workspace client's connection pool is only warm if the same
+    client is reused.
+    """
+
+    # The system message and analyze instruction never change, so they are built once
+    # and shared by all requests; treat them as read-only
+    SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+    ANALYZE_PROMPT = "Analyze this dartboard image and return the score for each dart visible on the board:"
+    ANALYZE_TEXT_CONTENT = {"type": "text", "text": ANALYZE_PROMPT}
+
+    IMAGE_URL_PREFIX = "data:image/jpeg;base64,"
+
+    INVOCATION_HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
+
+    FORMAT_CORRECTION_PROMPT = """CRITICAL: Your response must be ONLY numbers separated by commas. Nothing else.
+
+Examples of CORRECT responses:
+- "20, 60, 50" (for 3 darts)
+- "60, 50" (for 2 darts)
+- "20" (for 1 dart)
+- "0" (for no darts)
+
+Do NOT include any text, labels, or explanations. ONLY the numbers. Stop immediately after the last number.
+
+Now, what are the scores for each dart visible on the dartboard?"""
+
+    def __init__(
+        self,
+        workspace_client: WorkspaceClient,
+        max_concurrent_calls: int = 32,
+        hedge_with_validator: bool = False,
+        structured_output: bool = False
+    ):
         """Initialize the service with a Databricks workspace client"""
         self.ws = workspace_client
+        # The primary call asks for schema-constrained JSON; the format-correction
+        # retry stays as a fallback for endpoints that ignore response_format
+        self._structured_output = structured_output
+        # Endpoints that rejected response_format; they are only sent plain-text calls
+        self._plain_text_endpoints: Set[str] = set()
+        # Awaited detections send the format-correction prompt alongside the primary call
+        # instead of after it, trading a second model call for lower tail latency
+        self._hedge_with_validator = hedge_with_validator
+        # Blocking model calls run on a dedicated set of worker threads, sized to the
+        # client's connection pool, so they don't starve the shared threadpool
+        self._max_concurrent_calls = max_concurrent_calls
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+        # Detections currently running, so concurrent requests for the same frame share one call
+        self._inflight: Dict[bytes, "asyncio.Task[Tuple[List[int], str]]"] = {}
+        # Polling and retries resubmit the same frame; identical frames skip the model call
+        self._detection_cache: "OrderedDict[bytes, Tuple[List[int], str]]" = OrderedDict()
+        self._detection_cache_lock = threading.Lock()
+        # The prompt never changes, so it is logged once here rather than per request
+        logger.debug("System prompt:\n%s", SYSTEM_PROMPT)
+        logger.debug("User prompt: %s", self.ANALYZE_PROMPT)
+
+    @staticmethod
+    def _detection_cache_key(model_endpoint: str, image_base64: str) -> bytes:
+        """Hash the model endpoint and image into a compact cache key"""
+        digest = hashlib.blake2b(model_endpoint.encode(), digest_size=16)
+        digest.update(image_base64.encode())
+        return digest.digest()
+
+    def _get_cached_detection(self, key: bytes) -> Optional[Tuple[List[int], str]]:
+        """Look up a previous detection for the same frame"""
+        with self._detection_cache_lock:
+            cached = self._detection_cache.get(key)
+            if cached is None:
+                return None
+            self._detection_cache.move_to_end(key)
+        scores, raw_response = cached
+        return list(scores), raw_response
+
+    def _cache_detection(self, key: bytes, scores: List[int], raw_response: str) -> None:
+        """Remember a detection, evicting the least recently used entry when full"""
+        with self._detection_cache_lock:
+            self._detection_cache[key] = (list(scores), raw_response)
+            self._detection_cache.move_to_end(key)
+            if len(self._detection_cache) > DETECTION_CACHE_SIZE:
+                self._detection_cache.popitem(last=False)
     
-    def _create_image_content(self, image_base64: str, timestamp: float, label: str) -> dict:
+    def _create_image_content(self, image_base64: str) -> dict:
         """Create image content for the Claude API"""
+        # Clients may already send a data URI, which is passed through as-is to
+        # avoid copying the whole payload into a new string
+        if image_base64.startswith("data:"):
+            url = image_base64
+        else:
+            url = self.IMAGE_URL_PREFIX + image_base64
         return {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{image_base64}"
+                "url": url
             }
         }
     
@@ -63,174 +238,410 @@ ONLY return the comma-separated numbers. Nothing else.
     
     def detect_score(
         self,
-        before_image_base64: str,
-        after_image_base64: str,
-        before_timestamp: float,
-        after_timestamp: float,
+        image_base64: str,
+        timestamp: float,
         model_endpoint: str = "databricks-claude-sonnet-4-5"
     ) -> Tuple[List[int], str]:
         """
-        Detect the score from before/after dartboard images
+        Detect the scores of the darts on the board in an image
         
         Args:
-            before_image_base64: Base64 encoded image before the throw
-            after_image_base64: Base64 encoded image after the throw
-            before_timestamp: Timestamp of before image
-            after_timestamp: Timestamp of after image
+            image_base64: Base64 encoded image (or data URI) of the board after the throw
+            timestamp: Timestamp of the image in the video
             model_endpoint: The AI model endpoint to use
             
         Returns:
             Tuple of (list of scores for each dart, raw_response)
         """
         try:
-            logger.info(f"Calling model endpoint: {model_endpoint}")
-            
-            # Log image details for debugging
-            image_size_kb = len(after_image_base64) * 3 / 4 / 1024  # Approximate size in KB
-            logger.info(f"Image size: ~{image_size_kb:.2f} KB (base64 length: {len(after_image_base64)})")
-            logger.info(f"Timestamp: {after_timestamp:.2f}s")
-            
-            # Optionally save the image for debugging (if DEBUG_SAVE_IMAGES env var is set)
-            if os.getenv("DEBUG_SAVE_IMAGES", "").lower() == "true":
-                try:
-                    import tempfile
-                    from pathlib import Path
-                    debug_dir = Path(tempfile.gettempdir()) / "intelligent_darts_debug"
-                    debug_dir.mkdir(exist_ok=True)
-                    image_path = debug_dir / f"frame_{after_timestamp:.2f}s.jpg"
-                    
-                    # Decode and save the image
-                    image_data = base64.b64decode(after_image_base64)
-                    with open(image_path, "wb") as f:
-                        f.write(image_data)
-                    logger.info(f"DEBUG: Saved image to {image_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to save debug image: {e}")
-            
-            # Use the "after" image as the current frame to analyze
-            # (Frontend sends the same image for both, so we just use one)
-            user_message_content = [
-                self._create_text_content(
-                    "Analyze this dartboard image and return the score for each dart visible on the board:"
-                ),
-                self._create_image_content(after_image_base64, after_timestamp, "Current Frame")
-            ]
-            
-            # Create messages for the API
-            messages = [
-                ChatMessage(
-                    role=ChatMessageRole.SYSTEM,
-                    content=self.SYSTEM_PROMPT
-                ),
-                ChatMessage(
-                    role=ChatMessageRole.USER,
-                    content=user_message_content
-                )
-            ]
-            
-            # Log the prompt being sent (without the full image data)
-            logger.info("=" * 80)
-            logger.info("SYSTEM PROMPT:")
-            logger.info(self.SYSTEM_PROMPT)
-            logger.info("=" * 80)
-            logger.info("USER MESSAGE:")
-            logger.info("- Text: 'Analyze this dartboard image and return the score for each dart visible on the board:'")
-            logger.info(f"- Image: [base64 image data, ~{image_size_kb:.2f} KB]")
-            logger.info("=" * 80)
-            
-            # Query the model serving endpoint
-            response = self.ws.serving_endpoints.query(
-                name=model_endpoint,
-                messages=messages,
-                temperature=0.3,  # Lower temperature for more consistent scoring
-                max_tokens=100  # Allow more tokens for multiple dart responses
-            )
-            
-            # Log the full response structure for debugging
-            logger.info(f"Full API response type: {type(response)}")
-            logger.info(f"Full API response: {response}")
-            
-            # Check for usage/token info
-            if hasattr(response, 'usage'):
-                logger.info(f"Token usage - Prompt: {response.usage.prompt_tokens}, Completion: {response.usage.completion_tokens}, Total: {response.usage.total_tokens}")
-            
-            # Extract the response text
-            raw_response = ""
-            if hasattr(response, 'choices') and response.choices:
-                logger.info(f"Response has {len(response.choices)} choices")
-                choice = response.choices[0]
-                
-                # Check finish reason for issues
-                if hasattr(choice, 'finish_reason') and choice.finish_reason:
-                    logger.info(f"Finish reason: {choice.finish_reason}")
-                    if choice.finish_reason in ['content_filter', 'safety']:
-                        logger.error(f"Model response blocked by {choice.finish_reason}")
-                        raise ValueError(f"Model response blocked by {choice.finish_reason}. The image may have been flagged by safety filters.")
-                
-                if hasattr(choice, 'message'):
-                    logger.info(f"Choice 0 has message: {choice.message}")
-                    raw_response = choice.message.content or ""
-                    
-                    # Check if content is empty but there's a refusal
-                    if not raw_response and hasattr(choice.message, 'refusal') and choice.message.refusal:
-                        logger.error(f"Model refused to respond: {choice.message.refusal}")
-                        raise ValueError(f"Model refused: {choice.message.refusal}")
-                    
-                elif hasattr(choice, 'text'):
-                    logger.info(f"Choice 0 has text: {choice.text}")
-                    raw_response = choice.text or ""
-                else:
-                    logger.error(f"Choice 0 structure: {dir(choice)}")
-            else:
-                logger.error(f"Response structure: {dir(response)}")
-                logger.error(f"Response has no choices or choices is empty")
-            
-            # Check if response is empty
-            if not raw_response or raw_response.strip() == "":
-                logger.error(f"Model returned empty response. Model: {model_endpoint}, Completion tokens: {response.usage.completion_tokens if hasattr(response, 'usage') else 'unknown'}")
-                raise ValueError(f"Model {model_endpoint} returned empty response. This may indicate a compatibility issue or safety filter.")
-            
-            logger.info(f"Extracted raw response from model: {raw_response}")
+            cache_key = self._detection_cache_key(model_endpoint, image_base64)
+            cached = self._get_cached_detection(cache_key)
+            if cached is not None:
+                logger.info("Returning cached detection for an identical frame")
+                return cached
+
+            # Built once and shared with the format-correction retry
+            image_content = self._prepare_image_content(image_base64, timestamp, model_endpoint)
             
-            # Parse the scores from the response
-            scores = self._parse_scores(raw_response)
+            scores, raw_response = self._query_scores(model_endpoint, image_content)
             
             # If parsing failed (empty list), retry with format correction
             if not scores:
                 logger.warning("Initial parsing failed. Attempting format correction...")
                 scores, raw_response = self._retry_with_format_correction(
                     model_endpoint, 
-                    after_image_base64, 
-                    after_timestamp, 
+                    image_content, 
                     raw_response
                 )
-                
-                # If still empty after retry, return [0] as safe default
-                if not scores:
-                    logger.error("Both attempts failed. Returning [0] as safe default")
-                    scores = [0]
             
-            return scores, raw_response
+            return self._finish_detection(cache_key, scores, raw_response)
             
         except Exception as e:
             logger.error(f"Error detecting score: {str(e)}", exc_info=True)
             raise
     
-    def _retry_with_format_correction(
+    def _prepare_image_content(self, image_base64: str, timestamp: float, model_endpoint: str) -> dict:
+        """
+        Log the outgoing request and build the image content sent to the model
+        
+        Args:
+            image_base64: Base64 encoded image (or data URI) to analyze
+            timestamp: Timestamp of the image
+            model_endpoint: The AI model endpoint to use
+            
+        Returns:
+            Image content for the chat messages
+        """
+        image_size_kb = len(image_base64) * 3 / 4 / 1024  # Approximate size in KB
+        logger.info(
+            "Calling model endpoint %s (image ~%.1f KB, timestamp %.2fs)",
+            model_endpoint, image_size_kb, timestamp
+        )
+        
+        if _DEBUG_EXECUTOR is not None:
+            _DEBUG_EXECUTOR.submit(_write_debug_image, image_base64, timestamp)
+        
+        return self._create_image_content(image_base64)
+    
+    def _query_scores(self, model_endpoint: str, image_content: dict) -> Tuple[List[int], str]:
+        """
+        Ask the model for the dart scores with the primary prompt
+        
+        Args:
+            model_endpoint: The model endpoint to use
+            image_content: The image content to analyze
+            
+        Returns:
+            Tuple of (list of scores, raw response); the list is empty if parsing failed
+        """
+        messages = [
+            self.SYSTEM_MESSAGE,
+            {
+                "role": "user",
+                "content": [
+                    self.ANALYZE_TEXT_CONTENT,
+                    image_content
+                ]
+            }
+        ]
+        
+        # Query the model serving endpoint
+        response = None
+        if self._structured_output and model_endpoint not in self._plain_text_endpoints:
+            try:
+                response = self._query_endpoint(
+                    model_endpoint,
+                    messages,
+                    temperature=0.3,  # Lower temperature for more consistent scoring
+                    max_tokens=MAX_STRUCTURED_SCORE_TOKENS,
+                    response_format=SCORES_RESPONSE_FORMAT
+                )
+            except BadRequest as e:
+                if _RESPONSE_FORMAT_ERROR_RE.search(str(e)):
+                    # Not every provider accepts the schema; remember that and ask for plain text
+                    logger.warning("Endpoint %s rejected structured output, using plain text: %s", model_endpoint, e)
+                    self._plain_text_endpoints.add(model_endpoint)
+                else:
+                    # Likely a problem with this request (e.g. the image), so the endpoint
+                    # keeps structured output; retry this request once as plain text
+                    logger.warning("Structured request to %s failed, retrying as plain text: %s", model_endpoint, e)
+        if response is None:
+            response = self._query_endpoint(
+                model_endpoint,
+                messages,
+                temperature=0.3,  # Lower temperature for more consistent scoring
+                max_tokens=MAX_SCORE_TOKENS
+            )
+        
+        # The full response is only rendered when debug logging is on
+        logger.debug("Full API response: %s", response)
+        
+        # Check for usage/token info
+        usage = response.get("usage")
+        if usage:
+            logger.info(
+                "Token usage - Prompt: %s, Completion: %s, Total: %s",
+                usage.get("prompt_tokens"), usage.get("completion_tokens"), usage.get("total_tokens")
+            )
+        
+        # Extract the response text
+        raw_response = self._extract_response_text(response)
+        
+        # An empty answer (e.g. cut off by max_tokens) is a failed parse, so it goes
+        # through the format-correction retry and the [0] fallback like any other
+        if not raw_response or raw_response.strip() == "":
+            logger.warning(
+                "Model returned empty response. Model: %s, Completion tokens: %s",
+                model_endpoint, usage.get("completion_tokens") if usage else "unknown"
+            )
+            return [], raw_response
+        
+        logger.info("Extracted raw response from model: %s", raw_response)
+        
+        # Parse the scores from the response
+        return self._parse_scores(raw_response), raw_response
+    
+    def _finish_detection(self, cache_key: bytes, scores: List[int], raw_response: str) -> Tuple[List[int], str]:
+        """Cache a successful detection, or fall back to [0] if no attempt could be parsed"""
+        if not scores:
+            logger.error("Both attempts failed. Returning [0] as safe default")
+            # Not cached, so the next submission of this frame tries again
+            return [0], raw_response
+        
+        self._cache_detection(cache_key, scores, raw_response)
+        return scores, raw_response
+    
+    def _query_endpoint(
         self,
         model_endpoint: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Query the serving endpoint, retrying transient server errors
+        
+        The chat payload is built as plain dicts and posted through the workspace
+        client's API client, which keeps its authentication, connection pool and
+        retries while skipping the ChatMessage/QueryEndpointResponse conversions
+        of serving_endpoints.query.
+        
+        The SDK already retries throttling (429/503) and connection errors within its
+        retry_timeout_seconds budget; 500/504 responses are final for it, so those are
+        retried here with exponential backoff and jitter. Unparseable answers are a
+        content problem and are handled by _retry_with_format_correction instead.
+        
+        Args:
+            model_endpoint: The model endpoint to query
+            messages: Chat messages to send
+            temperature: Sampling temperature
+            max_tokens: Maximum number of answer tokens (raised for reasoning endpoints)
+            response_format: Structured output format; plain-text calls use stop sequences instead
+            
+        Returns:
+            The decoded JSON response of the serving endpoint
+        """
+        if model_endpoint in REASONING_ENDPOINTS:
+            max_tokens = max(max_tokens, REASONING_MAX_TOKENS)
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if response_format is None:
+            payload["stop"] = SCORE_STOP_SEQUENCES
+        else:
+            payload["response_format"] = response_format
+        for attempt in range(1, QUERY_MAX_ATTEMPTS + 1):
+            try:
+                return self.ws.api_client.do(
+                    "POST",
+                    f"/serving-endpoints/{model_endpoint}/invocations",
+                    body=payload,
+                    headers=self.INVOCATION_HEADERS
+                )
+            except (InternalError, DeadlineExceeded) as e:
+                if attempt == QUERY_MAX_ATTEMPTS:
+                    raise
+                backoff = min(QUERY_BACKOFF_MAX_SECONDS, QUERY_BACKOFF_INITIAL_SECONDS * 2 ** (attempt - 1))
+                delay = random.uniform(0, backoff)
+                logger.warning(
+                    "Transient error from %s (attempt %d/%d), retrying in %.2fs: %s",
+                    model_endpoint, attempt, QUERY_MAX_ATTEMPTS, delay, e
+                )
+                time.sleep(delay)
+    
+    def _extract_response_text(self, response: Dict[str, Any]) -> str:
+        """
+        Extract the text of the first choice from a serving endpoint response
+        
+        Args:
+            response: Decoded JSON response returned by _query_endpoint
+            
+        Returns:
+            The response text (empty string if the model returned no choices)
+        """
+        try:
+            choice = response["choices"][0]
+        except (KeyError, IndexError, TypeError):
+            logger.error("Response has no choices or choices is empty")
+            return ""
+        
+        # Check finish reason for issues
+        finish_reason = choice.get("finish_reason")
+        if finish_reason:
+            logger.debug("Finish reason: %s", finish_reason)
+            if finish_reason == "length":
+                logger.warning("Model response hit max_tokens")
+            if finish_reason in ['content_filter', 'safety']:
+                logger.error(f"Model response blocked by {finish_reason}")
+                raise ValueError(f"Model response blocked by {finish_reason}. The image may have been flagged by safety filters.")
+        
+        # Chat endpoints answer with a message, completion endpoints with plain text
+        message = choice.get("message")
+        if message is None:
+            return choice.get("text") or ""
+        
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            # Reasoning endpoints answer with content parts (reasoning + text)
+            content = "".join(
+                part.get("text") or "" for part in content
+                if isinstance(part, dict) and part.get("type") == "text"
+            )
+        # Check if content is empty but there's a refusal
+        refusal = message.get("refusal")
+        if not content and refusal:
+            logger.error(f"Model refused to respond: {refusal}")
+            raise ValueError(f"Model refused: {refusal}")
+        return content
+    
+    async def detect_score_async(
+        self,
         image_base64: str,
         timestamp: float,
-        previous_response: str
+        model_endpoint: str = "databricks-claude-sonnet-4-5"
+    ) -> Tuple[List[int], str]:
+        """
+        Awaitable variant of detect_score for use from the event loop
+        
+        The blocking SDK calls run in a worker thread, bounded by max_concurrent_calls.
+        Concurrent requests for an identical frame are coalesced onto a single call.
+        """
+        if self._limiter is None:
+            # Created lazily so it binds to the running event loop
+            self._limiter = anyio.CapacityLimiter(self._max_concurrent_calls)
+        
+        key = self._detection_cache_key(model_endpoint, image_base64)
+        task = self._inflight.get(key)
+        if task is None:
+            if self._hedge_with_validator:
+                task = asyncio.ensure_future(
+                    self._detect_score_hedged(image_base64, timestamp, model_endpoint)
+                )
+            else:
+                detect = partial(
+                    self.detect_score,
+                    image_base64=image_base64,
+                    timestamp=timestamp,
+                    model_endpoint=model_endpoint
+                )
+                task = asyncio.ensure_future(anyio.to_thread.run_sync(detect, limiter=self._limiter))
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._forget_inflight, key))
+        else:
+            logger.info("Joining in-flight detection for an identical frame")
+        
+        # Shielded so a disconnecting client doesn't cancel the call for other waiters
+        scores, raw_response = await asyncio.shield(task)
+        return list(scores), raw_response
+    
+    async def _detect_score_hedged(
+        self,
+        image_base64: str,
+        timestamp: float,
+        model_endpoint: str
+    ) -> Tuple[List[int], str]:
+        """
+        Run the primary call and the format-correction prompt side by side
+        
+        The primary answer is used whenever it parses, since only the primary call
+        carries the scoring rules in the system prompt. The validator is already
+        running when the primary fails, so a bad answer no longer costs a second
+        sequential round trip. A call can't be aborted once sent; an unused result
+        is simply discarded.
+        """
+        cache_key = self._detection_cache_key(model_endpoint, image_base64)
+        cached = self._get_cached_detection(cache_key)
+        if cached is not None:
+            logger.info("Returning cached detection for an identical frame")
+            return cached
+        
+        image_content = self._prepare_image_content(image_base64, timestamp, model_endpoint)
+        primary = asyncio.ensure_future(anyio.to_thread.run_sync(
+            self._query_scores, model_endpoint, image_content, limiter=self._limiter
+        ))
+        validator = asyncio.ensure_future(anyio.to_thread.run_sync(
+            self._retry_with_format_correction, model_endpoint, image_content, None, limiter=self._limiter
+        ))
+        
+        primary_error: Optional[Exception] = None
+        try:
+            try:
+                scores, raw_response = await primary
+            except Exception as e:
+                # Only the primary call raises; the validator reports failure as []
+                primary_error = e
+                scores, raw_response = [], ""
+            if not scores:
+                logger.warning("Primary answer failed, using the validator's answer")
+                # The validator's raw response is only used if it parsed
+                validator_scores, validator_response = await validator
+                if validator_scores:
+                    scores, raw_response = validator_scores, validator_response
+        finally:
+            validator.cancel()
+        
+        if not scores and primary_error is not None:
+            logger.error(f"Error detecting score: {str(primary_error)}", exc_info=primary_error)
+            raise primary_error
+        return self._finish_detection(cache_key, scores, raw_response)
+    
+    def detect_score_batch(
+        self,
+        images_base64: List[str],
+        model_endpoint: str = "databricks-claude-sonnet-4-5",
+        max_workers: int = 8
+    ) -> List[Tuple[List[int], str]]:
+        """
+        Detect the scores for many frames, for offline jobs such as backfills or labeling
+        
+        Identical frames are scored once, and at most max_workers model calls are in
+        flight so large jobs stay under the endpoint's rate limits. For very large
+        backfills, Databricks batch inference (ai_query) is the cheaper route.
+        
+        Args:
+            images_base64: Base64 encoded images (or data URIs) to score
+            model_endpoint: The AI model endpoint to use
+            max_workers: Maximum number of concurrent model calls
+            
+        Returns:
+            List of (list of scores, raw_response) tuples, in the order of images_base64
+        """
+        unique_images = list(dict.fromkeys(images_base64))
+        logger.info(
+            "Detecting scores for %d frame(s) (%d unique)", len(images_base64), len(unique_images)
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # The frame index stands in for the timestamp (used for logging and debug dumps)
+            futures = {
+                image: executor.submit(self.detect_score, image, float(index), model_endpoint)
+                for index, image in enumerate(unique_images)
+            }
+            return [futures[image].result() for image in images_base64]
+    
+    def _forget_inflight(self, key: bytes, task: "asyncio.Task[Tuple[List[int], str]]") -> None:
+        """Drop a finished detection from the in-flight table"""
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every waiter has gone away
+            task.exception()
+    
+    def _retry_with_format_correction(
+        self,
+        model_endpoint: str,
+        image_content: dict,
+        previous_response: Optional[str]
     ) -> Tuple[List[int], str]:
         """
         Retry the request with format correction instructions
         
         Args:
             model_endpoint: The model endpoint to use
-            image_base64: The image data
-            timestamp: The timestamp
-            previous_response: The previous response that failed to parse
+            image_content: The image content already sent with the first request
+            previous_response: The previous response that failed to parse, or None when
+                running alongside the primary call as a validator
             
         Returns:
             Tuple of (list of scores, raw response)
@@ -239,51 +650,40 @@ ONLY return the comma-separated numbers. Nothing else.
             logger.info("Retrying with format correction prompt...")
             
             # Create a follow-up message asking for correct format
-            correction_prompt = f"""Your previous response was: "{previous_response}"
+            if previous_response is None:
+                correction_prompt = "Analyze the dartboard image and respond with ONLY comma-separated numbers.\n\n"
+            else:
+                correction_prompt = f"""Your previous response was: "{previous_response}"
 
 This response could not be parsed correctly. Please analyze the dartboard image again and respond with ONLY comma-separated numbers.
 
-CRITICAL: Your response must be ONLY numbers separated by commas. Nothing else.
-
-Examples of CORRECT responses:
-- "20, 60, 50" (for 3 darts)
-- "60, 50" (for 2 darts)
-- "20" (for 1 dart)
-- "0" (for no darts)
-
-Do NOT include any text, labels, or explanations. ONLY the numbers.
-
-Now, what are the scores for each dart visible on the dartboard?"""
+"""
+            correction_prompt += self.FORMAT_CORRECTION_PROMPT
 
             user_message_content = [
-                self._create_image_content(image_base64, timestamp, "Dartboard"),
+                image_content,
                 self._create_text_content(correction_prompt)
             ]
             
             messages = [
-                ChatMessage(
-                    role=ChatMessageRole.USER,
-                    content=user_message_content
-                )
+                {
+                    "role": "user",
+                    "content": user_message_content
+                }
             ]
             
             # Query the model again
-            response = self.ws.serving_endpoints.query(
-                name=model_endpoint,
-                messages=messages,
+            response = self._query_endpoint(
+                model_endpoint,
+                messages,
                 temperature=0.1,  # Lower temperature for more deterministic output
-                max_tokens=50
+                max_tokens=MAX_CORRECTION_TOKENS
             )
             
             # Extract the response
-            corrected_response = ""
-            if hasattr(response, 'choices') and response.choices:
-                if hasattr(response.choices[0], 'message'):
-                    corrected_response = response.choices[0].message.content
-                elif hasattr(response.choices[0], 'text'):
-                    corrected_response = response.choices[0].text
+            corrected_response = self._extract_response_text(response)
             
-            logger.info(f"Corrected response from model: {corrected_response}")
+            logger.info("Corrected response from model: %s", corrected_response)
             
             # Try parsing again
             scores = self._parse_scores(corrected_response)
@@ -291,59 +691,108 @@ Now, what are the scores for each dart visible on the dartboard?"""
             # If still failed, return empty list (caller will handle default)
             if not scores:
                 logger.error("Format correction retry also failed. Returning empty list")
+                if previous_response is None:
+                    return [], corrected_response
                 return [], f"Original: {previous_response}\nCorrected attempt: {corrected_response}"
             
+            if previous_response is None:
+                return scores, corrected_response
             return scores, f"Original: {previous_response}\nCorrected: {corrected_response}"
             
         except Exception as e:
             logger.error(f"Error in format correction retry: {str(e)}", exc_info=True)
             # Return empty list (caller will handle default)
-            return [], previous_response
+            return [], previous_response or ""
     
     def _parse_scores(self, response: str) -> List[int]:
         """
         Parse multiple dart scores from the model response
         
         Args:
-            response: Raw response from the model (expected format: "20, 60, 50" or "20")
+            response: Raw response from the model (expected format: '{"scores": [20, 60, 50]}'
+                with structured output, otherwise "20, 60, 50" or "20")
             
         Returns:
             List of parsed integer scores (empty list if parsing completely fails)
         """
         try:
-            # Clean the response
-            cleaned = response.strip()
+            # Structured output; a malformed object (e.g. cut off by max_tokens) is a
+            # failed parse rather than something to scan for digits
+            if response.lstrip().startswith("{"):
+                numbers = self._parse_structured_scores(response)
+                if numbers is None:
+                    logger.warning("Malformed structured response: %s", response)
+                    return []  # Return empty to trigger retry
+                if not numbers:
+                    logger.info("Response indicates no darts visible")
+                    return [0]
+                return self._validate_scores(numbers, response)
+            
+            # Collect every run of digits in a single pass over the bytes, noting whether
+            # there is any text besides the numbers and their separators
+            numbers: List[int] = []
+            value = 0
+            in_number = False
+            has_text = False
+            for byte in response.encode("ascii", "replace"):
+                if 0x30 <= byte <= 0x39:
+                    value = value * 10 + (byte - 0x30)
+                    in_number = True
+                    continue
+                if in_number:
+                    numbers.append(value)
+                    value = 0
+                    in_number = False
+                if byte not in _SCORE_SEPARATORS:
+                    has_text = True
+            if in_number:
+                numbers.append(value)
             
-            # Check if response indicates no darts
-            if any(phrase in cleaned.lower() for phrase in ["no dart", "no visible dart", "empty", "none"]):
+            # Check if a free-text response indicates no darts
+            if has_text and _NO_DARTS_RE.search(response):
                 logger.info("Response indicates no darts visible")
                 return [0]
             
-            # Extract all numbers from the response
-            import re
-            numbers = re.findall(r'\d+', cleaned)
-            
             if numbers:
-                scores = []
-                for num_str in numbers:
-                    score = int(num_str)
-                    # Validate each score is in reasonable range (max 60 for triple 20)
-                    if 0 <= score <= 60:
-                        scores.append(score)
-                    else:
-                        logger.warning(f"Score {score} out of valid range (0-60), skipping")
-                
-                if scores:
-                    logger.info(f"Parsed {len(scores)} dart score(s): {scores}")
-                    return scores
-                else:
-                    logger.warning(f"No valid scores found in response: {response}")
-                    return []  # Return empty to trigger retry
+                return self._validate_scores(numbers, response)
             else:
-                logger.warning(f"Could not parse any scores from response: {response}")
+                logger.warning("Could not parse any scores from response: %s", response)
                 return []  # Return empty to trigger retry
                 
         except Exception as e:
-            logger.error(f"Error parsing scores from response '{response}': {str(e)}")
+            logger.error("Error parsing scores from response '%s': %s", response, e)
+            return []  # Return empty to trigger retry
+    
+    @staticmethod
+    def _parse_structured_scores(response: str) -> Optional[List[int]]:
+        """
+        Decode a structured output response ('{"scores": [20, 60, 50]}')
+        
+        Returns:
+            The list of scores, or None if the response is not a valid DartScores object
+        """
+        try:
+            numbers = json.loads(response)["scores"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(numbers, list) or not all(type(n) is int for n in numbers):
+            return None
+        return numbers
+    
+    def _validate_scores(self, numbers: List[int], response: str) -> List[int]:
+        """Keep the scores in the valid range (0-60), or return [] if none are"""
+        scores = []
+        for score in numbers:
+            # Validate each score is in reasonable range (max 60 for triple 20)
+            if 0 <= score <= 60:
+                scores.append(score)
+            else:
+                logger.warning("Score %d out of valid range (0-60), skipping", score)
+        
+        if scores:
+            logger.info("Parsed %d dart score(s): %s", len(scores), scores)
+            return scores
+        else:
+            logger.warning("No valid scores found in response: %s", response)
             return []  # Return empty to trigger retry
 
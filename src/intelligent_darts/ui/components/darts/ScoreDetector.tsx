@@ -6,6 +6,11 @@ import { useDetectScore } from "@/lib/api";
 import { useState, useRef, useCallback } from "react";
 import { Sparkles, AlertCircle, CheckCircle2 } from "lucide-react";
 
+// Frames are downscaled before upload: Claude doesn't need full HD to read a
+// dartboard, and vision tokens (and upload bytes) scale with the pixel count
+const MAX_FRAME_EDGE = 768;
+const FRAME_JPEG_QUALITY = 0.7;
+
 interface ScoreDetectorProps {
   videoRef: React.RefObject<HTMLVideoElement | null>;
   selectedModel: string;
@@ -39,8 +44,11 @@ export function ScoreDetector({ videoRef, selectedModel }: ScoreDetectorProps) {
       return null;
     }
 
-    canvas.width = video.videoWidth || 640;
-    canvas.height = video.videoHeight || 480;
+    const width = video.videoWidth || 640;
+    const height = video.videoHeight || 480;
+    const scale = Math.min(1, MAX_FRAME_EDGE / Math.max(width, height));
+    canvas.width = Math.round(width * scale);
+    canvas.height = Math.round(height * scale);
 
     const ctx = canvas.getContext('2d');
     if (!ctx) {
@@ -49,11 +57,10 @@ export function ScoreDetector({ videoRef, selectedModel }: ScoreDetectorProps) {
     
     ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-    const dataUrl = canvas.toDataURL('image/jpeg', 0.8);
-    const base64 = dataUrl.split(',')[1];
+    const dataUrl = canvas.toDataURL('image/jpeg', FRAME_JPEG_QUALITY);
     const timestamp = video.currentTime;
 
-    return { base64, timestamp };
+    return { dataUrl, timestamp };
   }, [videoRef]);
 
   const handleDetectScore = async () => {
@@ -64,17 +71,15 @@ export function ScoreDetector({ videoRef, selectedModel }: ScoreDetectorProps) {
     }
 
     // Store the captured image as a data URL for display
-    const imageDataUrl = `data:image/jpeg;base64,${currentFrame.base64}`;
-    setCapturedImageUrl(imageDataUrl);
+    setCapturedImageUrl(currentFrame.dataUrl);
 
     try {
       // Send the current frame for analysis
-      // Note: API still expects before/after fields for compatibility, but we send the same image
+      // Only the "after" frame is analyzed, so no "before" image or timestamp is sent
       const result = await detectScoreMutation.mutateAsync({
         data: {
-          before_image_base64: currentFrame.base64,
-          after_image_base64: currentFrame.base64,  // Current frame to analyze
-          before_timestamp: currentFrame.timestamp,
+          // The data URL is sent as-is so the backend can forward it without re-wrapping
+          after_image_base64: currentFrame.dataUrl,  // Current frame to analyze
           after_timestamp: currentFrame.timestamp,
           model: selectedModel,
         }
@@ -64,16 +64,29 @@ export interface Name {
   given_name?: NameGivenName;
 }
 
+/**
+ * Base64 encoded image of the dartboard before the throw (raw or as a data URI). Not used for detection and can be omitted
+ */
+export type ScoreDetectionInBeforeImageBase64 = string | null;
+
+/**
+ * Timestamp of the before image in seconds. Not used for detection and can be omitted
+ */
+export type ScoreDetectionInBeforeTimestamp = number | null;
+
 /**
  * Input model for score detection from video frames
  */
 export interface ScoreDetectionIn {
-  /** Base64 encoded image of the dartboard before the throw */
-  before_image_base64: string;
-  /** Base64 encoded image of the dartboard after the throw */
+  /** Base64 encoded image of the dartboard before the throw (raw or as a data URI). Not used for detection and can be omitted */
+  before_image_base64?: ScoreDetectionInBeforeImageBase64;
+  /**
+   * Base64 encoded image of the dartboard after the throw (raw or as a data URI)
+   * @maxLength 700000
+   */
   after_image_base64: string;
-  /** Timestamp of the before image in seconds */
-  before_timestamp: number;
+  /** Timestamp of the before image in seconds. Not used for detection and can be omitted */
+  before_timestamp?: ScoreDetectionInBeforeTimestamp;
   /** Timestamp of the after image in seconds */
   after_timestamp: number;
   /** The AI model endpoint to use for detection */
@@ -1173,10 +1186,11 @@ export function useGetGameStatusSuspense<
 }
 
 /**
- * Detect the score from before/after dartboard images using Claude Sonnet 4.5
+ * Detect the dart scores in a dartboard frame using Claude Sonnet 4.5
 
-This endpoint analyzes two timestamped images of a dartboard and uses AI
-to determine what score was achieved by the newly thrown dart.
+This endpoint analyzes the "after" frame of a dartboard and uses AI to
+determine the score of each dart on the board. The "before" fields are
+optional and ignored.
  * @summary Detect Score
  */
 export const detectScore = (
@@ -1257,3 +1271,93 @@ export const useDetectScore = <
 
   return useMutation(mutationOptions, queryClient);
 };
+
+/**
+ * Detect the scores for several frames at once
+
+Frames are analyzed concurrently, so a burst of throws takes about one model
+round trip instead of one per frame. Results are returned in request order.
+ * @summary Detect Scores Batch
+ */
+export const detectScoresBatch = (
+  scoreDetectionIn: ScoreDetectionIn[],
+  options?: AxiosRequestConfig,
+): Promise<AxiosResponse<ScoreDetectionOut[]>> => {
+  return axios.default.post(
+    `/api/detect-scores-batch`,
+    scoreDetectionIn,
+    options,
+  );
+};
+
+export const getDetectScoresBatchMutationOptions = <
+  TError = AxiosError<HTTPValidationError>,
+  TContext = unknown,
+>(options?: {
+  mutation?: UseMutationOptions<
+    Awaited<ReturnType<typeof detectScoresBatch>>,
+    TError,
+    { data: ScoreDetectionIn[] },
+    TContext
+  >;
+  axios?: AxiosRequestConfig;
+}): UseMutationOptions<
+  Awaited<ReturnType<typeof detectScoresBatch>>,
+  TError,
+  { data: ScoreDetectionIn[] },
+  TContext
+> => {
+  const mutationKey = ["detectScoresBatch"];
+  const { mutation: mutationOptions, axios: axiosOptions } = options
+    ? options.mutation &&
+      "mutationKey" in options.mutation &&
+      options.mutation.mutationKey
+      ? options
+      : { ...options, mutation: { ...options.mutation, mutationKey } }
+    : { mutation: { mutationKey }, axios: undefined };
+
+  const mutationFn: MutationFunction<
+    Awaited<ReturnType<typeof detectScoresBatch>>,
+    { data: ScoreDetectionIn[] }
+  > = (props) => {
+    const { data } = props ?? {};
+
+    return detectScoresBatch(data, axiosOptions);
+  };
+
+  return { mutationFn, ...mutationOptions };
+};
+
+export type DetectScoresBatchMutationResult = NonNullable<
+  Awaited<ReturnType<typeof detectScoresBatch>>
+>;
+export type DetectScoresBatchMutationBody = ScoreDetectionIn[];
+export type DetectScoresBatchMutationError = AxiosError<HTTPValidationError>;
+
+/**
+ * @summary Detect Scores Batch
+ */
+export const useDetectScoresBatch = <
+  TError = AxiosError<HTTPValidationError>,
+  TContext = unknown,
+>(
+  options?: {
+    mutation?: UseMutationOptions<
+      Awaited<ReturnType<typeof detectScoresBatch>>,
+      TError,
+      { data: ScoreDetectionIn[] },
+      TContext
+    >;
+    axios?: AxiosRequestConfig;
+  },
+  queryClient?: QueryClient,
+): UseMutationResult<
+  Awaited<ReturnType<typeof detectScoresBatch>>,
+  TError,
+  { data: ScoreDetectionIn[] },
+  TContext
+> => {
+  const mutationOptions = getDetectScoresBatchMutationOptions(options);
+
+  return useMutation(mutationOptions, queryClient);
+};